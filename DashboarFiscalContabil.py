@@ -1,7 +1,14 @@
+import hashlib
+import io
+import re
+from contextlib import contextmanager
+
 import streamlit as st
+import numpy as np
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
 import streamlit.components.v1 as components
+from openpyxl import load_workbook
 
 # ------------------------------------------------------------------------------
 # Configuração da página (deve ser a primeira instrução)
@@ -10,32 +17,288 @@ st.set_page_config(page_title="Dashboard Fiscal Avançada", layout="wide")
 
 # ------------------------------------------------------------------------------
 # Função para converter a coluna MÊS tentando diferentes formatos
+# Como os meses se repetem, só os valores distintos são convertidos e o resultado é
+# espalhado de volta para as linhas. Cada formato é aplicado de uma vez sobre esses
+# valores; os formatos seguintes só tentam os que ainda não foram convertidos.
 # ------------------------------------------------------------------------------
-def converter_mes(valor):
-    formatos = ["%Y-%m", "%m/%Y", "%B %Y", "%b %Y"]  # Ex.: "2023-05", "05/2023", "Maio 2023", "May 2023"
-    for fmt in formatos:
-        try:
-            return pd.to_datetime(valor, format=fmt)
-        except (ValueError, TypeError):
-            continue
-    return pd.NaT  # Retorna Not a Time se nenhum formato funcionar
+FORMATOS_MES = ["%Y-%m", "%m/%Y", "%B %Y", "%b %Y"]  # Ex.: "2023-05", "05/2023", "Maio 2023", "May 2023"
+
+# %B/%b só reconhecem nomes em inglês: os nomes em português (completos ou abreviados)
+# são traduzidos antes da conversão
+MESES_PT = {
+    "janeiro": "January", "fevereiro": "February", "março": "March", "marco": "March",
+    "abril": "April", "maio": "May", "junho": "June", "julho": "July", "agosto": "August",
+    "setembro": "September", "outubro": "October", "novembro": "November", "dezembro": "December",
+    "fev": "Feb", "abr": "Apr", "mai": "May", "ago": "Aug", "set": "Sep", "out": "Oct", "dez": "Dec",
+}
+NOME_MES = re.compile(r"^[^\W\d_]+")
+
+def traduzir_mes(valor):
+    if not isinstance(valor, str):
+        return valor
+    return NOME_MES.sub(lambda m: MESES_PT.get(m.group(0).lower(), m.group(0)), valor.strip())
+
+def converter_mes(s):
+    codes, uniques = pd.factorize(s)  # Valores vazios recebem o código -1
+    valores = pd.Series(uniques).map(traduzir_mes)
+    out = pd.to_datetime(valores, format=FORMATOS_MES[0], errors="coerce")
+    for fmt in FORMATOS_MES[1:]:
+        mask = out.isna()
+        if not mask.any():
+            break
+        out.loc[mask] = pd.to_datetime(valores[mask], format=fmt, errors="coerce")
+    # Valores sem formato reconhecido (e vazios) ficam como NaT
+    datas = pd.DatetimeIndex(out).take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(datas, index=s.index, name=s.name)
 
 # ------------------------------------------------------------------------------
 # Função para formatar números no padrão brasileiro (ponto para milhares e vírgula para decimais)
-# Se o valor for 0 ou NaN, retorna string vazia.
+# Se o valor for 0 (menos de meio centavo) ou NaN, retorna string vazia.
+# A troca de separadores é feita em uma única passada (str.translate).
 # ------------------------------------------------------------------------------
+BR_TRANS = str.maketrans({",": ".", ".": ","})
+
 def format_brl(x):
     try:
-        if pd.isna(x) or (isinstance(x, (int, float)) and x == 0):
+        if pd.isna(x) or (isinstance(x, (int, float, np.floating)) and abs(x) < 0.005):
             return ""
-        return format(x, ",.2f").replace(",", "X").replace(".", ",").replace("X", ".")
-    except:
-        return x
+        return format(x, ",.2f").translate(BR_TRANS)
+    except (TypeError, ValueError):
+        return x  # Valor não numérico: devolve como veio
+
+# ------------------------------------------------------------------------------
+# Função que devolve as colunas como matriz float64.
+# Só as colunas guardadas em float32 são arredondadas no centavo (desfaz o erro de
+# representação), a mesma regra da tabela; as demais seguem com o valor original.
+# A matriz é montada direto dos arrays de cada coluna, sem criar o DataFrame df[cols].
+# ------------------------------------------------------------------------------
+def valores_float64(df, cols):
+    if not cols:
+        return np.empty((len(df), 0))
+    return np.column_stack([
+        df[col].to_numpy(dtype="float64").round(2) if df[col].dtype == "float32"
+        else df[col].to_numpy(dtype="float64")
+        for col in cols
+    ])
+
+# ------------------------------------------------------------------------------
+# Métricas disponíveis e despesas que compõem "Despesas Totais".
+# Excluímos "CARTAO E PIX" das despesas.
+# ------------------------------------------------------------------------------
+METRICS_OPTIONS = (
+    "COMPRAS", "VENDAS", "DAS", "FOLHA", "PRO-LABORE", "FGTS",
+    "MULTA FGTS", "RESCISÃO", "FÉRIAS", "13 SALARIO", "DCTFWEB",
+    "Contrib. Assistencial", "ISSQN Retido", "CARTAO E PIX"
+)
+DESPESAS = (
+    "COMPRAS", "DAS", "FOLHA", "PRO-LABORE", "FGTS",
+    "MULTA FGTS", "RESCISÃO", "FÉRIAS", "13 SALARIO", "DCTFWEB",
+    "Contrib. Assistencial", "ISSQN Retido"
+)
+# Métricas com gráfico próprio, fora do "Comparativo de Outras Métricas"
+METRICAS_COM_GRAFICO = frozenset({"VENDAS", "COMPRAS", "DAS", "CARTAO E PIX"})
+
+# ------------------------------------------------------------------------------
+# Limites dos caches (compartilhados por todas as sessões do servidor).
+# Dimensionados para SESSOES_SIMULTANEAS usuários: cada um guarda sua planilha,
+# os gráficos da aba de resumo (até 6 por filtro) e a tabela do filtro atual,
+# com folga para alguns filtros anteriores. As entradas mais antigas são
+# descartadas primeiro; as planilhas também expiram após CACHE_TTL_PLANILHA.
+# ------------------------------------------------------------------------------
+SESSOES_SIMULTANEAS = 20
+CACHE_TTL_PLANILHA = "1h"
+
+# ------------------------------------------------------------------------------
+# Função para ler a primeira planilha do XLSX.
+# Usa o python-calamine (parser em Rust, pandas >= 2.2) quando disponível; caso
+# contrário, o openpyxl em modo somente leitura, que percorre as células em fluxo
+# sem montar a árvore completa da planilha.
+# ------------------------------------------------------------------------------
+def ler_xlsx(file_bytes):
+    try:
+        return pd.read_excel(io.BytesIO(file_bytes), engine="calamine")
+    except (ImportError, ValueError):
+        pass  # python-calamine não instalado ou pandas sem suporte ao engine
+    return ler_xlsx_openpyxl(file_bytes)
+
+# ------------------------------------------------------------------------------
+# Nomes das colunas como o pd.read_excel os monta: cabeçalho em branco vira
+# "Unnamed: i" e nomes repetidos recebem os sufixos ".1", ".2", ... (pulando os
+# sufixos que já existem na planilha; colunas nomeadas têm prioridade)
+# ------------------------------------------------------------------------------
+def rotular_colunas(header):
+    sem_nome = [i for i, nome in enumerate(header) if nome is None or nome == ""]
+    nomes = [f"Unnamed: {i}" if i in sem_nome else nome for i, nome in enumerate(header)]
+    contagem = {}
+    for i in [i for i in range(len(nomes)) if i not in sem_nome] + sem_nome:
+        nome = original = nomes[i]
+        atual = contagem.get(nome, 0)
+        while atual > 0:
+            contagem[original] = atual + 1
+            nome = f"{original}.{atual}"
+            atual = atual + 1 if nome in nomes else contagem.get(nome, 0)
+        nomes[i] = nome
+        contagem[nome] = atual + 1
+    return nomes
+
+def ler_xlsx_openpyxl(file_bytes):
+    wb = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        # Primeira planilha, como no read_excel (não a que estava selecionada ao salvar)
+        rows = list(wb.worksheets[0].iter_rows(values_only=True))
+    finally:
+        wb.close()
+    if not rows:
+        return pd.DataFrame()  # Planilha vazia
+    # Células formatadas, mas vazias, à direita dos dados não viram colunas (como no read_excel)
+    largura = max(
+        (i + 1 for row in rows for i, valor in enumerate(row) if valor is not None),
+        default=0,
+    )
+    header, *dados = [row[:largura] for row in rows]
+    df = pd.DataFrame(dados, columns=rotular_colunas(header))
+    # Linhas totalmente vazias (comuns ao final da planilha) são descartadas
+    return df.dropna(how="all").reset_index(drop=True)
+
+# ------------------------------------------------------------------------------
+# Leitura do arquivo XLSX e preparação da coluna de datas.
+# O resultado fica em cache (chave: bytes do arquivo), de modo que as interações
+# com os widgets não reprocessam a planilha a cada execução do script.
+# ------------------------------------------------------------------------------
+@st.cache_data(show_spinner=False, ttl=CACHE_TTL_PLANILHA, max_entries=SESSOES_SIMULTANEAS)
+def load_df(file_bytes: bytes) -> pd.DataFrame:
+    df = ler_xlsx(file_bytes)
+    if "MÊS" not in df.columns:
+        return df  # A validação da coluna é feita no fluxo principal
+
+    # Colunas float64 passam para float32 (metade da memória e do tráfego) sempre que
+    # isso não muda nenhum valor exibido no centavo; as somas continuam em float64.
+    for col in df.select_dtypes(include="float64").columns:
+        as32 = df[col].astype("float32")
+        if as32.astype("float64").round(2).equals(df[col].round(2)):
+            df[col] = as32
+
+    # Converte a coluna MÊS para datetime utilizando a função personalizada
+    df["Data"] = converter_mes(df["MÊS"])
+    if not df["Data"].notna().any():
+        # Nenhuma data convertida: mantém os valores originais ordenados
+        return df.sort_values("MÊS", kind="stable")
+
+    # Remove registros com data inválida e ordena pela coluna Data
+    df.dropna(subset=["Data"], inplace=True)
+    df.sort_values("Data", inplace=True, kind="stable")
+    # Coluna formatada para exibição (mês/ano), categórica: poucos valores distintos
+    df["MÊS_FORMATADO"] = df["Data"].dt.strftime("%m/%Y").astype("category")
+    return df
+
+# ------------------------------------------------------------------------------
+# Construção dos gráficos em cache.
+# A chave é o hash das colunas plotadas (chart_key) mais os parâmetros do gráfico;
+# o DataFrame em si (_df) não é hasheado novamente pelo Streamlit.
+# Os traços recebem diretamente os arrays NumPy de cada coluna (Scattergl usa WebGL);
+# título dos eixos e legenda seguem o padrão que o plotly.express gerava.
+# Para cada gráfico, forçamos a exibição dos números completos (sem abreviação).
+# ------------------------------------------------------------------------------
+@st.cache_data(show_spinner=False, max_entries=SESSOES_SIMULTANEAS * 6 * 2)
+def build_chart(chart_key, _df, x, ys, title, kind="line"):
+    ys = (ys,) if isinstance(ys, str) else tuple(ys)
+    xs = _df[x].to_numpy()
+    fig = go.Figure()
+    for y in ys:
+        if kind == "bar":
+            fig.add_trace(go.Bar(x=xs, y=_df[y].to_numpy(), name=y))
+        else:
+            fig.add_trace(go.Scattergl(x=xs, y=_df[y].to_numpy(), name=y, mode="lines+markers"))
+    fig.update_layout(
+        title=title, template="plotly_white", barmode="group",
+        showlegend=len(ys) > 1, legend_title_text="variable",
+        xaxis_title=x, yaxis_title=ys[0] if len(ys) == 1 else "value",
+    )
+    fig.update_yaxes(tickformat=',.2f', exponentformat='none')
+    fig.update_traces(hovertemplate='%{y:,.2f}')
+    return fig
+
+# ------------------------------------------------------------------------------
+# Gráfico com chave própria: hash dos nomes e dos valores apenas das colunas que
+# ele plota (o hash_pandas_object ignora os nomes). Marcar ou desmarcar outra
+# métrica não invalida os gráficos que não a utilizam.
+# ------------------------------------------------------------------------------
+def grafico(df, x, ys, title, kind="line"):
+    ys = (ys,) if isinstance(ys, str) else tuple(ys)
+    cols = [x, *ys]
+    chave = hashlib.md5(repr(cols).encode())
+    chave.update(pd.util.hash_pandas_object(df[cols], index=False).values)
+    return build_chart(chave.digest(), df, x, ys, title, kind)
 
 # ------------------------------------------------------------------------------
-# Injeção de CSS para customização visual avançada
+# Preparação da tabela da aba "Visualização dos Dados" (cópia para exibição, linha
+# de total e configuração das colunas), em cache: a cada execução resta apenas
+# serializar o resultado. A chave (tabela_key) é montada no fluxo principal a partir
+# do upload e dos filtros; o DataFrame em si (_df) não é hasheado pelo Streamlit.
 # ------------------------------------------------------------------------------
-st.markdown(
+@st.cache_data(show_spinner=False, max_entries=SESSOES_SIMULTANEAS * 2)
+def build_display(tabela_key, _df):
+    # Cria uma cópia para exibição já sem as colunas auxiliares (Data e MÊS_FORMATADO),
+    # em vez de copiar tudo e removê-las depois. As colunas float32 voltam para float64
+    # (no centavo) para que a linha de total não perca precisão
+    display_cols = [col for col in _df.columns if col not in ("Data", "MÊS_FORMATADO")]
+    float32_cols = _df[display_cols].select_dtypes(include="float32").columns
+    display_df = _df.loc[:, display_cols].astype({col: "float64" for col in float32_cols})
+    display_df = display_df.round({col: 2 for col in float32_cols})
+    # Se a conversão ocorreu, utiliza a coluna formatada para exibição
+    if "MÊS_FORMATADO" in _df.columns:
+        # "Total" entra nas categorias para a linha de total não converter a coluna em object
+        display_df["MÊS"] = _df["MÊS_FORMATADO"].cat.add_categories("Total")
+
+    # Sem datas convertidas, MÊS pode ter ficado numérico (ex.: 202305): é um rótulo, não um
+    # valor, então vira texto para receber "Total" e ficar fora da soma e da formatação
+    mes_cols = [col for col in display_df.columns if str(col).upper() == "MÊS"]
+    for col in mes_cols:
+        if pd.api.types.is_numeric_dtype(display_df[col]):
+            display_df[col] = display_df[col].astype(str)
+
+    # Colunas numéricas identificadas uma única vez (usadas no total e na formatação)
+    numeric_cols = display_df.select_dtypes(include="number").columns
+
+    # Adiciona uma linha de total para as colunas numéricas e texto "Total" para a coluna MÊS
+    # (uma única redução sobre as colunas numéricas; as demais ficam em branco)
+    total_series = display_df[numeric_cols].sum().reindex(display_df.columns, fill_value="")
+    total_series[mes_cols] = "Total"
+    # A linha é incluída direto via .loc; as colunas categóricas recuperam o dtype original
+    cat_dtypes = display_df.select_dtypes(include="category").dtypes.to_dict()
+    display_df.loc["Total"] = total_series
+    display_df = display_df.astype(cat_dtypes)
+
+    # As colunas numéricas seguem como números; a formatação fica a cargo do navegador.
+    # Valores zero (menos de meio centavo) viram NaN para continuarem sendo exibidos em branco.
+    display_df[numeric_cols] = display_df[numeric_cols].mask(display_df[numeric_cols].abs() < 0.005)
+    # Células vazias das colunas de texto também ficam em branco, como na linha de total
+    texto_cols = display_df.select_dtypes(include=["object", "string"]).columns
+    display_df[texto_cols] = display_df[texto_cols].fillna("")
+
+    # Índice em texto (linhas numeradas + "Total" não formam um tipo único no Arrow) e colunas
+    # com backend pyarrow: sem o Styler, o st.dataframe envia o frame em Arrow e reaproveita esses
+    # buffers, sem converter as colunas. Sem convert_integer, uma coluna de valores monetários
+    # que por acaso só tenha valores inteiros não deixa de ser float.
+    display_df.index = display_df.index.astype(str)
+    display_df = display_df.convert_dtypes(dtype_backend="pyarrow", convert_integer=False)
+    # Colunas numéricas formatadas pelo navegador (column_config), conforme o locale,
+    # sem o Styler, que formataria cada célula em Python a cada execução
+    col_cfg = {col: st.column_config.NumberColumn(format="localized") for col in numeric_cols}
+    return display_df, col_cfg
+
+# ------------------------------------------------------------------------------
+# Moldura dos gráficos e da tabela: container nativo com borda, sem injeção de HTML
+# ------------------------------------------------------------------------------
+@contextmanager
+def moldura():
+    with st.container(border=True):
+        yield
+
+# ------------------------------------------------------------------------------
+# CSS para customização visual avançada
+# ------------------------------------------------------------------------------
+CSS = (
     """
     <style>
     @import url('https://fonts.googleapis.com/css2?family=Montserrat:wght@400;700&family=Roboto&display=swap');
@@ -53,30 +316,34 @@ st.markdown(
         border-radius: 10px;
         margin-bottom: 20px;
     }
-    .chart-container, .data-container {
-        background: white;
-        padding: 20px;
-        border-radius: 8px;
-        margin-bottom: 20px;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-    }
     </style>
-    """, unsafe_allow_html=True
+    """
 )
 
 # ------------------------------------------------------------------------------
 # Header customizado com HTML
 # ------------------------------------------------------------------------------
-components.html(
+HEADER_HTML = (
     """
     <div class="header">
         <h1>Dashboard Fiscal Avançada</h1>
         <p>Visualize e interaja com os dados financeiros da sua empresa</p>
     </div>
-    """, 
-    height=150
+    """
 )
 
+# ------------------------------------------------------------------------------
+# Injeção do CSS e do header.
+# Com cache_resource, o Streamlit grava as mensagens na primeira execução e apenas
+# as reenvia nas seguintes, sem reprocessar o markdown a cada interação.
+# ------------------------------------------------------------------------------
+@st.cache_resource(show_spinner=False)
+def inject_style():
+    st.markdown(CSS, unsafe_allow_html=True)
+    components.html(HEADER_HTML, height=150)
+
+inject_style()
+
 # ------------------------------------------------------------------------------
 # Sidebar: Upload, filtros e seleção de métricas
 # ------------------------------------------------------------------------------
@@ -85,51 +352,60 @@ uploaded_file = st.sidebar.file_uploader("Selecione o arquivo XLSX", type=["xlsx
 
 if uploaded_file is not None:
     try:
-        # Leitura do arquivo XLSX
-        df = pd.read_excel(uploaded_file)
+        # Leitura do arquivo XLSX (em cache). O DataFrame fica na sessão, identificado pelo
+        # upload, para que as execuções seguintes nem precisem hashear os bytes do arquivo.
+        # Sem file_id (versões antigas do Streamlit), o id é o hash do conteúdo: ele também
+        # compõe chaves de cache compartilhadas entre sessões, então nome e tamanho não bastam.
+        upload_id = getattr(uploaded_file, "file_id", None) or hashlib.md5(uploaded_file.getvalue()).hexdigest()
+        if st.session_state.get("df_upload_id") != upload_id:
+            st.session_state["df"] = load_df(uploaded_file.getvalue())
+            st.session_state["df_upload_id"] = upload_id
+        # Cópia rasa: novas colunas (ex.: Despesas Totais) não alteram o DataFrame da sessão
+        df = st.session_state["df"].copy(deep=False)
         
         # Verifica se a coluna MÊS existe
         if "MÊS" not in df.columns:
             st.error("A coluna 'MÊS' não foi encontrada no arquivo.")
             st.stop()
         
-        # Converte a coluna MÊS para datetime utilizando a função personalizada
-        df["Data"] = df["MÊS"].apply(converter_mes)
-        if df["Data"].isnull().all():
+        # A coluna formatada só existe quando a conversão de datas ocorreu
+        if "MÊS_FORMATADO" in df.columns:
+            x_axis = "Data"
+        else:
             st.warning("Não foi possível converter a coluna 'MÊS' para data. Usaremos os valores originais.")
             x_axis = "MÊS"
-            df.sort_values("MÊS", inplace=True)
-        else:
-            # Remove registros com data inválida e ordena pela coluna Data
-            df = df[df["Data"].notnull()]
-            df.sort_values("Data", inplace=True)
-            x_axis = "Data"
         
-        # Se a conversão ocorreu, criamos uma coluna formatada para exibição (mês/ano)
-        if x_axis == "Data":
-            df["MÊS_FORMATADO"] = df["Data"].dt.strftime("%m/%Y")
+        # Checkbox para incluir todas as métricas. Fica fora do formulário para que a
+        # seleção manual só apareça (e só valha) quando ele está desmarcado
+        include_all = st.sidebar.checkbox("Incluir todas as métricas", value=True)
+        
+        # Os filtros ficam em um formulário: alterar vários campos gera uma única
+        # execução do script, ao clicar em "Aplicar". Até lá, os widgets devolvem
+        # os últimos valores aplicados (ou os valores padrão, na primeira execução).
+        with st.sidebar.form("filters"):
+            # Filtro de intervalo de datas (apenas se a conversão ocorreu)
+            if x_axis == "Data":
+                min_date = df["Data"].min().date()
+                max_date = df["Data"].max().date()
+                date_range = st.date_input("Selecione o intervalo de datas", [min_date, max_date])
+            if not include_all:
+                metricas_escolhidas = st.multiselect("Selecione as métricas:", METRICS_OPTIONS, default=list(METRICS_OPTIONS))
+            st.form_submit_button("Aplicar")
         
-        # Filtro de intervalo de datas (apenas se a conversão ocorreu)
-        if x_axis == "Data":
-            min_date = df["Data"].min().date()
-            max_date = df["Data"].max().date()
-            date_range = st.sidebar.date_input("Selecione o intervalo de datas", [min_date, max_date])
-            if isinstance(date_range, list) and len(date_range) == 2:
-                start_date, end_date = date_range
-                df = df[(df["Data"].dt.date >= start_date) & (df["Data"].dt.date <= end_date)]
+        if x_axis == "Data" and isinstance(date_range, (list, tuple)) and len(date_range) == 2:
+            start_date, end_date = date_range
+            # df já vem ordenado por Data: basta localizar os limites por busca binária
+            date_values = df["Data"].values
+            lo = np.searchsorted(date_values, np.datetime64(start_date))
+            hi = np.searchsorted(date_values, np.datetime64(end_date) + np.timedelta64(1, "D"))
+            df = df.iloc[lo:hi]
         
-        # Lista de métricas disponíveis
-        metrics_options = [
-            "COMPRAS", "VENDAS", "DAS", "FOLHA", "PRO-LABORE", "FGTS",
-            "MULTA FGTS", "RESCISÃO", "FÉRIAS", "13 SALARIO", "DCTFWEB",
-            "Contrib. Assistencial", "ISSQN Retido", "CARTAO E PIX"
-        ]
-        # Checkbox para incluir todas as métricas
-        include_all = st.sidebar.checkbox("Incluir todas as métricas", value=True)
         if include_all:
-            selected_metrics = metrics_options
+            selected_metrics = list(METRICS_OPTIONS)
         else:
-            selected_metrics = st.sidebar.multiselect("Selecione as métricas:", metrics_options, default=metrics_options)
+            selected_metrics = metricas_escolhidas
+        # Conjunto para os testes de pertinência (a lista mantém a ordem de exibição)
+        sel = frozenset(selected_metrics)
         
         # ------------------------------------------------------------------------------
         # Criação de abas: "Dashboard" para os cards e gráficos; "Visualização dos Dados" para a tabela
@@ -142,146 +418,80 @@ if uploaded_file is not None:
         with tabs[0]:
             st.markdown("## Resumo Geral")
             col1, col2, col3, col4 = st.columns(4)
-            total_vendas  = df["VENDAS"].sum()  if "VENDAS"  in df.columns else 0
-            total_compras = df["COMPRAS"].sum() if "COMPRAS" in df.columns else 0
-            total_das     = df["DAS"].sum()     if "DAS"     in df.columns else 0
-            total_folha   = df["FOLHA"].sum()   if "FOLHA"   in df.columns else 0
-            col1.metric("Total Vendas", format_brl(total_vendas))
-            col2.metric("Total Compras", format_brl(total_compras))
-            col3.metric("Total DAS", format_brl(total_das))
-            col4.metric("Total Folha", format_brl(total_folha))
+            # Uma única redução, acumulada em float64, só sobre as colunas dos cards;
+            # colunas ausentes no arquivo contam como zero
+            card_cols = ["VENDAS", "COMPRAS", "DAS", "FOLHA"]
+            present_cols = [c for c in card_cols if c in df.columns]
+            totals = pd.Series(
+                np.nansum(valores_float64(df, present_cols), axis=0), index=present_cols
+            ).reindex(card_cols, fill_value=0)
+            col1.metric("Total Vendas", format_brl(totals["VENDAS"]))
+            col2.metric("Total Compras", format_brl(totals["COMPRAS"]))
+            col3.metric("Total DAS", format_brl(totals["DAS"]))
+            col4.metric("Total Folha", format_brl(totals["FOLHA"]))
             
             # Criação de uma coluna para Despesas Totais (soma das despesas selecionadas)
-            # Excluímos "CARTAO E PIX" desta soma.
-            despesas_list = [
-                "COMPRAS", "DAS", "FOLHA", "PRO-LABORE", "FGTS",
-                "MULTA FGTS", "RESCISÃO", "FÉRIAS", "13 SALARIO", "DCTFWEB",
-                "Contrib. Assistencial", "ISSQN Retido"
-            ]
-            despesas_selecionadas = [col for col in despesas_list if col in selected_metrics]
+            despesas_selecionadas = [col for col in DESPESAS if col in sel]
             if despesas_selecionadas:
-                df["Despesas Totais"] = df[despesas_selecionadas].sum(axis=1)
+                # Soma direta sobre a matriz NumPy (NaN é ignorado, como no pandas)
+                df["Despesas Totais"] = np.nansum(valores_float64(df, despesas_selecionadas), axis=1)
             
-            # Para cada gráfico, forçamos a exibição dos números completos (sem abreviação)
+            # Recorte com apenas as colunas usadas nos gráficos, compartilhado por todos eles
+            # (VENDAS entra sempre: o gráfico de Cartão e PIX compara com ela)
+            needed = {x_axis, "VENDAS", "Despesas Totais"} | sel
+            # Valores arredondados no centavo: menos dígitos no JSON enviado ao navegador
+            chart_df = df.loc[:, [c for c in df.columns if c in needed]]
+            chart_df = chart_df.round({c: 2 for c in chart_df.select_dtypes(include="number").columns})
             
             # Gráfico 1: Evolução das Vendas
-            if "VENDAS" in selected_metrics:
-                fig_vendas = px.line(
-                    df, x=x_axis, y="VENDAS",
-                    title="Evolução das Vendas",
-                    markers=True,
-                    template="plotly_white"
-                )
-                fig_vendas.update_yaxes(tickformat=',.2f', exponentformat='none')
-                fig_vendas.update_traces(hovertemplate='%{y:,.2f}')
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_vendas, use_container_width=True, config={"locale": "pt-BR"})
-                st.markdown("</div>", unsafe_allow_html=True)
+            if "VENDAS" in sel:
+                fig_vendas = grafico(chart_df, x_axis, "VENDAS", "Evolução das Vendas")
+                with moldura():
+                    st.plotly_chart(fig_vendas, use_container_width=True, config={"locale": "pt-BR"})
             
             # Gráfico 2: Vendas vs DAS
-            if all(m in selected_metrics for m in ["VENDAS", "DAS"]):
-                fig_vdas = px.line(
-                    df, x=x_axis, y=["VENDAS", "DAS"],
-                    title="Vendas vs DAS",
-                    markers=True,
-                    template="plotly_white"
-                )
-                fig_vdas.update_yaxes(tickformat=',.2f', exponentformat='none')
-                fig_vdas.update_traces(hovertemplate='%{y:,.2f}')
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_vdas, use_container_width=True, config={"locale": "pt-BR"})
-                st.markdown("</div>", unsafe_allow_html=True)
+            if {"VENDAS", "DAS"} <= sel:
+                fig_vdas = grafico(chart_df, x_axis, ("VENDAS", "DAS"), "Vendas vs DAS")
+                with moldura():
+                    st.plotly_chart(fig_vdas, use_container_width=True, config={"locale": "pt-BR"})
             
             # Gráfico 3: Vendas vs Compras
-            if all(m in selected_metrics for m in ["VENDAS", "COMPRAS"]):
-                fig_vcompras = px.line(
-                    df, x=x_axis, y=["VENDAS", "COMPRAS"],
-                    title="Vendas vs Compras",
-                    markers=True,
-                    template="plotly_white"
-                )
-                fig_vcompras.update_yaxes(tickformat=',.2f', exponentformat='none')
-                fig_vcompras.update_traces(hovertemplate='%{y:,.2f}')
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_vcompras, use_container_width=True, config={"locale": "pt-BR"})
-                st.markdown("</div>", unsafe_allow_html=True)
+            if {"VENDAS", "COMPRAS"} <= sel:
+                fig_vcompras = grafico(chart_df, x_axis, ("VENDAS", "COMPRAS"), "Vendas vs Compras")
+                with moldura():
+                    st.plotly_chart(fig_vcompras, use_container_width=True, config={"locale": "pt-BR"})
             
             # Gráfico 4: Resumo Fiscal - Vendas vs Despesas Totais
-            if "Despesas Totais" in df.columns and "VENDAS" in selected_metrics:
-                fig_resumo = px.bar(
-                    df, x=x_axis, y=["VENDAS", "Despesas Totais"],
-                    title="Resumo Fiscal: Vendas vs Despesas Totais",
-                    barmode="group",
-                    template="plotly_white"
-                )
-                fig_resumo.update_yaxes(tickformat=',.2f', exponentformat='none')
-                fig_resumo.update_traces(hovertemplate='%{y:,.2f}')
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_resumo, use_container_width=True, config={"locale": "pt-BR"})
-                st.markdown("</div>", unsafe_allow_html=True)
+            if "Despesas Totais" in df.columns and "VENDAS" in sel:
+                fig_resumo = grafico(chart_df, x_axis, ("VENDAS", "Despesas Totais"), "Resumo Fiscal: Vendas vs Despesas Totais", kind="bar")
+                with moldura():
+                    st.plotly_chart(fig_resumo, use_container_width=True, config={"locale": "pt-BR"})
             
             # Gráfico adicional: Comparativo de Outras Métricas
             # Excluímos "CARTAO E PIX" deste comparativo, pois ele terá gráfico próprio.
-            selected_other_metrics = [m for m in selected_metrics if m not in ["VENDAS", "COMPRAS", "DAS", "CARTAO E PIX"]]
+            selected_other_metrics = [m for m in selected_metrics if m not in METRICAS_COM_GRAFICO]
             if selected_other_metrics:
-                fig_other = px.line(
-                    df, x=x_axis, y=selected_other_metrics,
-                    title="Comparativo de Outras Métricas",
-                    markers=True,
-                    template="plotly_white"
-                )
-                fig_other.update_yaxes(tickformat=',.2f', exponentformat='none')
-                fig_other.update_traces(hovertemplate='%{y:,.2f}')
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_other, use_container_width=True, config={"locale": "pt-BR"})
-                st.markdown("</div>", unsafe_allow_html=True)
+                fig_other = grafico(chart_df, x_axis, tuple(selected_other_metrics), "Comparativo de Outras Métricas")
+                with moldura():
+                    st.plotly_chart(fig_other, use_container_width=True, config={"locale": "pt-BR"})
             
             # Novo Gráfico: Comparativo de Vendas vs CARTAO E PIX
-            if "CARTAO E PIX" in selected_metrics:
-                fig_cartao = px.line(
-                    df, x=x_axis, y=["VENDAS", "CARTAO E PIX"],
-                    title="Comparativo: Vendas vs Cartão e PIX",
-                    markers=True,
-                    template="plotly_white"
-                )
-                fig_cartao.update_yaxes(tickformat=',.2f', exponentformat='none')
-                fig_cartao.update_traces(hovertemplate='%{y:,.2f}')
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_cartao, use_container_width=True, config={"locale": "pt-BR"})
-                st.markdown("</div>", unsafe_allow_html=True)
+            if "CARTAO E PIX" in sel:
+                fig_cartao = grafico(chart_df, x_axis, ("VENDAS", "CARTAO E PIX"), "Comparativo: Vendas vs Cartão e PIX")
+                with moldura():
+                    st.plotly_chart(fig_cartao, use_container_width=True, config={"locale": "pt-BR"})
         
         # --------------------------------------------------------------------------
         # Aba "Visualização dos Dados": Tabela com os dados e total final
         # --------------------------------------------------------------------------
         with tabs[1]:
-            st.markdown("<div class='data-container'>", unsafe_allow_html=True)
-            st.subheader("Visualização dos Dados")
-            # Cria uma cópia para exibição
-            display_df = df.copy()
-            # Se a conversão ocorreu, utiliza a coluna formatada para exibição
-            if "MÊS_FORMATADO" in display_df.columns:
-                display_df["MÊS"] = display_df["MÊS_FORMATADO"]
-            # Remove as colunas auxiliares que não deseja mostrar
-            for col_to_drop in ["Data", "MÊS_FORMATADO"]:
-                if col_to_drop in display_df.columns:
-                    display_df.drop(col_to_drop, axis=1, inplace=True)
-            
-            # Adiciona uma linha de total para as colunas numéricas e texto "Total" para a coluna MÊS
-            total_values = {}
-            for col in display_df.columns:
-                if pd.api.types.is_numeric_dtype(display_df[col]):
-                    total_values[col] = display_df[col].sum()
-                else:
-                    total_values[col] = "Total" if col.upper() == "MÊS" else ""
-            total_df = pd.DataFrame(total_values, index=["Total"])
-            display_df = pd.concat([display_df, total_df])
-            
-            # Aplica formatação: se o valor for numérico e zero ou NaN, exibe em branco; caso contrário, formata
-            display_df = display_df.applymap(lambda x: "" if (isinstance(x, (int, float)) and (pd.isna(x) or x == 0)) 
-                                             else format_brl(x) if isinstance(x, (int, float)) 
-                                             else x)
-            st.dataframe(display_df)
-            st.markdown("</div>", unsafe_allow_html=True)
+            # Tabela de exibição em cache: a chave identifica o upload, o intervalo de datas e
+            # as despesas que compõem "Despesas Totais" (tudo o que altera o conteúdo da tabela)
+            tabela_key = (upload_id, date_range if x_axis == "Data" else None, tuple(despesas_selecionadas))
+            display_df, col_cfg = build_display(tabela_key, df)
+            with moldura():
+                st.subheader("Visualização dos Dados")
+                st.dataframe(display_df, column_config=col_cfg)
             
     except Exception as e:
         st.error(f"Erro ao processar o arquivo: {e}")
@@ -0,0 +1,59 @@
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.styles import PatternFill
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import DashboarFiscalContabil as app  # noqa: E402
+
+
+def planilha(header, *linhas, celula_formatada=None):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(header)
+    for linha in linhas:
+        ws.append(linha)
+    if celula_formatada:
+        ws[celula_formatada].fill = PatternFill("solid", fgColor="FFFF00")
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def test_openpyxl_monta_as_colunas_como_read_excel():
+    data = planilha(
+        ["MÊS", None, "VENDAS", "VENDAS", None, "VENDAS.1", "VENDAS"],
+        ["2023-01", 1, 2.5, 3, 4, 5, 6],
+        ["2023-02", None, 2, 3, None, 5, 6],
+        celula_formatada="J6",
+    )
+    esperado = pd.read_excel(io.BytesIO(data), engine="openpyxl")
+    obtido = app.ler_xlsx_openpyxl(data)
+    assert list(obtido.columns) == list(esperado.columns)
+    assert obtido.shape == esperado.shape
+
+
+def test_openpyxl_le_a_primeira_planilha():
+    wb = Workbook()
+    wb.active.append(["MÊS", "VENDAS"])
+    wb.active.append(["2023-01", 1])
+    outra = wb.create_sheet("Outra")
+    outra.append(["OUTRA", "COLUNA", "EXTRA"])
+    wb.active = 1  # Planilha selecionada ao salvar não é a primeira
+    buf = io.BytesIO()
+    wb.save(buf)
+    data = buf.getvalue()
+    esperado = pd.read_excel(io.BytesIO(data), engine="openpyxl")
+    obtido = app.ler_xlsx_openpyxl(data)
+    assert list(obtido.columns) == list(esperado.columns) == ["MÊS", "VENDAS"]
+    assert obtido.shape == esperado.shape
+
+
+def test_openpyxl_planilha_vazia():
+    wb = Workbook()
+    buf = io.BytesIO()
+    wb.save(buf)
+    assert app.ler_xlsx_openpyxl(buf.getvalue()).empty